@@ -1,11 +1,34 @@
-"""Caching utilities for travel-time and directions lookups."""
+"""Caching utilities for travel-time and directions lookups.
+
+Coordinates are quantised to 5 decimal places (~1 m) before they become
+cache keys, so near-identical floats produced by different upstream paths
+hit the same entry. The ~1 m precision loss is well below venue-level
+accuracy.
+"""
 from __future__ import annotations
 
+import os
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional, Tuple
+from typing import Dict, Hashable, Optional, Sequence, Tuple
+
+import orjson
+from psycopg.types.json import Jsonb
+
+from .pool import get_pool
+
+
+def quantise(coord: Sequence[float]) -> Tuple[float, float]:
+    """Round a (lat, lng) pair to 5 decimal places (~1 m) for cache keys."""
+    return (round(float(coord[0]), 5), round(float(coord[1]), 5))
 
-import psycopg
+
+def _jsonb(meta: Dict[str, object]) -> Jsonb:
+    """Wrap meta for the binary wire protocol, serialised once via orjson."""
+    return Jsonb(meta, dumps=orjson.dumps)
 
 
 @dataclass(frozen=True)
@@ -16,13 +39,39 @@ class MatrixCacheKey:
     destination: Tuple[float, float]
     bucket: Optional[str] = None
 
+    def __post_init__(self) -> None:
+        # The memory layer probes this key O(N^2) times per solve, so the
+        # hashable form packs each endpoint's quantised lat/lng into one
+        # int64 — integer tuples hash and compare faster than float pairs.
+        # The ints are derived from the same round(x, 4) values serialise()
+        # formats, so both layers agree on cell boundaries; rounding the raw
+        # floats on a separate grid would let the two key forms diverge near
+        # cell edges. The text form only matters on a Postgres round-trip,
+        # so it is built lazily in serialise().
+        o = (int(round(round(self.origin[0], 4) * 1e4)) << 32) | (
+            int(round(round(self.origin[1], 4) * 1e4)) & 0xFFFFFFFF
+        )
+        d = (int(round(round(self.destination[0], 4) * 1e4)) << 32) | (
+            int(round(round(self.destination[1], 4) * 1e4)) & 0xFFFFFFFF
+        )
+        object.__setattr__(self, "_packed", (self.provider, self.mode, o, d, self.bucket))
+
+    def pack(self) -> Tuple:
+        """Cheap hashable form for in-process lookups."""
+        return self._packed  # type: ignore[attr-defined]
+
     def serialise(self) -> str:
-        lat1 = round(self.origin[0], 4)
-        lng1 = round(self.origin[1], 4)
-        lat2 = round(self.destination[0], 4)
-        lng2 = round(self.destination[1], 4)
-        bucket = f":{self.bucket}" if self.bucket else ""
-        return f"{self.provider}:{self.mode}:{lat1},{lng1}->{lat2},{lng2}{bucket}"
+        try:
+            return self._serialised  # type: ignore[attr-defined]
+        except AttributeError:
+            lat1 = round(self.origin[0], 4)
+            lng1 = round(self.origin[1], 4)
+            lat2 = round(self.destination[0], 4)
+            lng2 = round(self.destination[1], 4)
+            bucket = f":{self.bucket}" if self.bucket else ""
+            serialised = f"{self.provider}:{self.mode}:{lat1},{lng1}->{lat2},{lng2}{bucket}"
+            object.__setattr__(self, "_serialised", serialised)
+            return serialised
 
 
 @dataclass(frozen=True)
@@ -32,12 +81,112 @@ class DirectionsCacheKey:
     origin: Tuple[float, float]
     destination: Tuple[float, float]
 
-    def serialise(self) -> str:
+    def __post_init__(self) -> None:
         lat1 = round(self.origin[0], 5)
         lng1 = round(self.origin[1], 5)
         lat2 = round(self.destination[0], 5)
         lng2 = round(self.destination[1], 5)
-        return f"{self.provider}:{self.mode}:{lat1},{lng1}->{lat2},{lng2}"
+        serialised = f"{self.provider}:{self.mode}:{lat1},{lng1}->{lat2},{lng2}"
+        object.__setattr__(self, "_serialised", serialised)
+
+    def serialise(self) -> str:
+        return self._serialised  # type: ignore[attr-defined]
+
+
+# SQL text for the hot cache paths is kept at module level so repeated
+# executions hash to the same statement and benefit from server-side
+# prepared statements (see api.pool prepare_threshold).
+_MATRIX_GET_SQL = """
+SELECT duration_sec, distance_m, meta, expires_at
+FROM matrix_cache
+WHERE cache_key = %s
+  AND expires_at > %s
+"""
+
+_MATRIX_GET_MANY_SQL = """
+SELECT cache_key, duration_sec, distance_m, meta, expires_at
+FROM matrix_cache
+WHERE cache_key = ANY(%s::text[])
+  AND expires_at > %s
+"""
+
+_MATRIX_STORE_SQL = """
+INSERT INTO matrix_cache (cache_key, provider, mode, duration_sec, distance_m, meta, expires_at)
+VALUES (%s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (cache_key)
+DO UPDATE SET duration_sec = EXCLUDED.duration_sec,
+              distance_m = EXCLUDED.distance_m,
+              meta = EXCLUDED.meta,
+              expires_at = EXCLUDED.expires_at,
+              provider = EXCLUDED.provider,
+              mode = EXCLUDED.mode
+"""
+
+_DIRECTIONS_GET_SQL = """
+SELECT polyline, duration_sec, distance_m, meta, expires_at
+FROM directions_cache
+WHERE cache_key = %s
+  AND expires_at > %s
+"""
+
+_DIRECTIONS_STORE_SQL = """
+INSERT INTO directions_cache (cache_key, provider, mode, polyline, duration_sec, distance_m, meta, expires_at)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (cache_key)
+DO UPDATE SET polyline = EXCLUDED.polyline,
+              duration_sec = EXCLUDED.duration_sec,
+              distance_m = EXCLUDED.distance_m,
+              meta = EXCLUDED.meta,
+              expires_at = EXCLUDED.expires_at,
+              provider = EXCLUDED.provider,
+              mode = EXCLUDED.mode
+"""
+
+
+class _MemoryLayer:
+    """Bounded in-process LRU sitting in front of a Postgres cache table.
+
+    Absorbs repeated lookups for the same key within a process (e.g. the
+    same origin-destination pair across sessions at one venue) before they
+    cost a network round-trip. Entries expire on a monotonic clock so the
+    layer never outlives the Postgres TTL. The repositories are process-wide
+    singletons shared across the solver's thread fan-outs, so all dict
+    mutation happens under a lock.
+    """
+
+    def __init__(self, maxsize: int, ttl_minutes: int) -> None:
+        self.maxsize = maxsize
+        self.ttl_sec = ttl_minutes * 60
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Dict[str, object]]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Dict[str, object]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if time.monotonic() >= expires:
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Dict[str, object], ttl_sec: Optional[float] = None) -> None:
+        # Rows read back from Postgres pass their remaining lifetime so the
+        # memory copy never outlives the row's expires_at.
+        ttl = self.ttl_sec if ttl_sec is None else min(self.ttl_sec, ttl_sec)
+        with self._lock:
+            entries = self._entries
+            entries[key] = (time.monotonic() + ttl, value)
+            entries.move_to_end(key)
+            while len(entries) > self.maxsize:
+                entries.popitem(last=False)
+
+
+# DSN+table pairs that have already run their CREATE TABLE this process, so
+# repository re-instantiation (tests, reloads) doesn't re-issue DDL.
+_DDL_DONE: set = set()
 
 
 class _BaseCacheRepository:
@@ -45,7 +194,11 @@ class _BaseCacheRepository:
 
     def __init__(self, dsn: str) -> None:
         self.dsn = dsn
-        self._ensure_table()
+        self.pool = get_pool(dsn)
+        ddl_key = (dsn, type(self).__name__)
+        if os.getenv("GOPTI_SKIP_DDL") != "1" and ddl_key not in _DDL_DONE:
+            self._ensure_table()
+            _DDL_DONE.add(ddl_key)
 
     def _ensure_table(self) -> None:  # pragma: no cover - table creation
         raise NotImplementedError
@@ -54,6 +207,7 @@ class _BaseCacheRepository:
 class MatrixCacheRepository(_BaseCacheRepository):
     def __init__(self, dsn: str, *, ttl_minutes: int = 1440) -> None:
         self.ttl_minutes = ttl_minutes
+        self._mem = _MemoryLayer(maxsize=8192, ttl_minutes=ttl_minutes)
         super().__init__(dsn)
 
     def _ensure_table(self) -> None:  # pragma: no cover - DDL
@@ -68,55 +222,119 @@ class MatrixCacheRepository(_BaseCacheRepository):
             expires_at TIMESTAMPTZ NOT NULL,
             created_at TIMESTAMPTZ NOT NULL DEFAULT now()
         );
+        -- meta is deliberately not INCLUDEd: jsonb payloads can push the
+        -- index tuple past the btree size cap and fail the INSERT.
+        CREATE INDEX IF NOT EXISTS matrix_cache_live
+            ON matrix_cache (cache_key)
+            INCLUDE (duration_sec, distance_m, expires_at);
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
+        with self.pool.connection() as conn, conn.cursor() as cur:
             cur.execute(sql)
             conn.commit()
 
     def get(self, key: MatrixCacheKey) -> Optional[Dict[str, object]]:
-        sql = """
-        SELECT duration_sec, distance_m, meta
-        FROM matrix_cache
-        WHERE cache_key = %s
-          AND expires_at > now()
-        """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql, (key.serialise(),))
+        mem_key = key.pack()
+        hit = self._mem.get(mem_key)
+        if hit is not None:
+            return hit
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            now = datetime.now(timezone.utc)
+            cur.execute(_MATRIX_GET_SQL, (key.serialise(), now), prepare=True)
             row = cur.fetchone()
         if not row:
             return None
-        duration, distance, meta = row
-        return {
+        duration, distance, meta, expires_at = row
+        value = {
             "duration_sec": int(duration),
             "distance_m": int(distance) if distance is not None else None,
             "meta": meta or {},
         }
+        self._mem.put(mem_key, value, ttl_sec=(expires_at - now).total_seconds())
+        return value
+
+    def get_many(self, keys: Sequence[MatrixCacheKey]) -> Dict[Tuple, Dict[str, object]]:
+        """Fetch many cache entries in one round-trip, keyed by key.pack()."""
+        if not keys:
+            return {}
+        found: Dict[Tuple, Dict[str, object]] = {}
+        misses = []
+        miss_keys: Dict[str, Tuple] = {}
+        for key in keys:
+            mem_key = key.pack()
+            hit = self._mem.get(mem_key)
+            if hit is not None:
+                found[mem_key] = hit
+            else:
+                cache_key = key.serialise()
+                misses.append(cache_key)
+                miss_keys[cache_key] = mem_key
+        if not misses:
+            return found
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            now = datetime.now(timezone.utc)
+            cur.execute(_MATRIX_GET_MANY_SQL, (misses, now), prepare=True)
+            rows = cur.fetchall()
+        for cache_key, duration, distance, meta, expires_at in rows:
+            value = {
+                "duration_sec": int(duration),
+                "distance_m": int(distance) if distance is not None else None,
+                "meta": meta or {},
+            }
+            mem_key = miss_keys[cache_key]
+            self._mem.put(mem_key, value, ttl_sec=(expires_at - now).total_seconds())
+            found[mem_key] = value
+        return found
+
+    def store_many(
+        self,
+        entries: Sequence[Tuple[MatrixCacheKey, int, Optional[int], Dict[str, object]]],
+    ) -> None:
+        """Upsert many cache entries with a single executemany round-trip."""
+        if not entries:
+            return
+        expiry = datetime.now(timezone.utc) + timedelta(minutes=self.ttl_minutes)
+        rows = [
+            (
+                key.serialise(),
+                key.provider,
+                key.mode,
+                int(duration_sec),
+                int(distance_m) if distance_m is not None else None,
+                _jsonb(meta),
+                expiry,
+            )
+            for key, duration_sec, distance_m, meta in entries
+        ]
+        for row, (key, _, _, meta) in zip(rows, entries):
+            self._mem.put(key.pack(), {"duration_sec": row[3], "distance_m": row[4], "meta": meta or {}})
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            cur.executemany(_MATRIX_STORE_SQL, rows, returning=False)
+            conn.commit()
 
     def store(self, key: MatrixCacheKey, duration_sec: int, distance_m: Optional[int], meta: Dict[str, object]) -> None:
         expiry = datetime.now(timezone.utc) + timedelta(minutes=self.ttl_minutes)
-        sql = """
-        INSERT INTO matrix_cache (cache_key, provider, mode, duration_sec, distance_m, meta, expires_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (cache_key)
-        DO UPDATE SET duration_sec = EXCLUDED.duration_sec,
-                      distance_m = EXCLUDED.distance_m,
-                      meta = EXCLUDED.meta,
-                      expires_at = EXCLUDED.expires_at,
-                      provider = EXCLUDED.provider,
-                      mode = EXCLUDED.mode
-        """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
+        self._mem.put(
+            key.pack(),
+            {
+                "duration_sec": int(duration_sec),
+                "distance_m": int(distance_m) if distance_m is not None else None,
+                "meta": meta or {},
+            },
+        )
+        with self.pool.connection() as conn, conn.cursor() as cur:
             cur.execute(
-                sql,
+                _MATRIX_STORE_SQL,
                 (
                     key.serialise(),
                     key.provider,
                     key.mode,
                     int(duration_sec),
                     int(distance_m) if distance_m is not None else None,
-                    meta,
+                    _jsonb(meta),
                     expiry,
                 ),
+                prepare=True,
+                binary=True,
             )
             conn.commit()
 
@@ -124,6 +342,7 @@ class MatrixCacheRepository(_BaseCacheRepository):
 class DirectionsCacheRepository(_BaseCacheRepository):
     def __init__(self, dsn: str, *, ttl_minutes: int = 10080) -> None:
         self.ttl_minutes = ttl_minutes
+        self._mem = _MemoryLayer(maxsize=4096, ttl_minutes=ttl_minutes)
         super().__init__(dsn)
 
     def _ensure_table(self) -> None:  # pragma: no cover - DDL
@@ -139,30 +358,37 @@ class DirectionsCacheRepository(_BaseCacheRepository):
             expires_at TIMESTAMPTZ NOT NULL,
             created_at TIMESTAMPTZ NOT NULL DEFAULT now()
         );
+        -- polyline/meta are deliberately not INCLUDEd: a full-overview
+        -- polyline routinely exceeds the btree index-tuple size cap, which
+        -- would make the upsert itself fail.
+        CREATE INDEX IF NOT EXISTS directions_cache_live
+            ON directions_cache (cache_key)
+            INCLUDE (duration_sec, distance_m, expires_at);
         """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
+        with self.pool.connection() as conn, conn.cursor() as cur:
             cur.execute(sql)
             conn.commit()
 
     def get(self, key: DirectionsCacheKey) -> Optional[Dict[str, object]]:
-        sql = """
-        SELECT polyline, duration_sec, distance_m, meta
-        FROM directions_cache
-        WHERE cache_key = %s
-          AND expires_at > now()
-        """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
-            cur.execute(sql, (key.serialise(),))
+        cache_key = key.serialise()
+        hit = self._mem.get(cache_key)
+        if hit is not None:
+            return hit
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            now = datetime.now(timezone.utc)
+            cur.execute(_DIRECTIONS_GET_SQL, (cache_key, now), prepare=True)
             row = cur.fetchone()
         if not row:
             return None
-        polyline, duration, distance, meta = row
-        return {
+        polyline, duration, distance, meta, expires_at = row
+        value = {
             "polyline": polyline,
             "duration_sec": int(duration) if duration is not None else None,
             "distance_m": int(distance) if distance is not None else None,
             "meta": meta or {},
         }
+        self._mem.put(cache_key, value, ttl_sec=(expires_at - now).total_seconds())
+        return value
 
     def store(
         self,
@@ -173,21 +399,18 @@ class DirectionsCacheRepository(_BaseCacheRepository):
         meta: Dict[str, object],
     ) -> None:
         expiry = datetime.now(timezone.utc) + timedelta(minutes=self.ttl_minutes)
-        sql = """
-        INSERT INTO directions_cache (cache_key, provider, mode, polyline, duration_sec, distance_m, meta, expires_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (cache_key)
-        DO UPDATE SET polyline = EXCLUDED.polyline,
-                      duration_sec = EXCLUDED.duration_sec,
-                      distance_m = EXCLUDED.distance_m,
-                      meta = EXCLUDED.meta,
-                      expires_at = EXCLUDED.expires_at,
-                      provider = EXCLUDED.provider,
-                      mode = EXCLUDED.mode
-        """
-        with psycopg.connect(self.dsn) as conn, conn.cursor() as cur:
+        self._mem.put(
+            key.serialise(),
+            {
+                "polyline": polyline,
+                "duration_sec": int(duration_sec) if duration_sec is not None else None,
+                "distance_m": int(distance_m) if distance_m is not None else None,
+                "meta": meta or {},
+            },
+        )
+        with self.pool.connection() as conn, conn.cursor() as cur:
             cur.execute(
-                sql,
+                _DIRECTIONS_STORE_SQL,
                 (
                     key.serialise(),
                     key.provider,
@@ -195,8 +418,10 @@ class DirectionsCacheRepository(_BaseCacheRepository):
                     polyline,
                     int(duration_sec) if duration_sec is not None else None,
                     int(distance_m) if distance_m is not None else None,
-                    meta,
+                    _jsonb(meta),
                     expiry,
                 ),
+                prepare=True,
+                binary=True,
             )
             conn.commit()
@@ -3,51 +3,65 @@ from __future__ import annotations
 
 from contextlib import contextmanager
 from datetime import date
-from typing import Dict, Iterable, Iterator, List
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 
 import psycopg
+from psycopg.rows import dict_row
 
-from .schemas import SolveEvent
+from .pool import get_pool
 
 
 @contextmanager
 def get_conn(dsn: str) -> Iterator[psycopg.Connection]:
-    conn = psycopg.connect(dsn)
-    try:
+    with get_pool(dsn).connection() as conn:
         yield conn
-    finally:
-        conn.close()
-
-
-def fetch_candidates(conn: psycopg.Connection, event_ids: Iterable[str], target_date: date) -> List[Dict[str, object]]:
-    sql = """
-    SELECT e.id AS event_id,
-           e.event_name,
-           e.min_dwell_min,
-           v.id AS venue_id,
-           v.name AS venue_name,
-           v.address,
-           v.lat,
-           v.lng,
-           s.start_ts,
-           s.end_ts
-    FROM events e
-    JOIN venues v ON v.id = e.venue_id
-    JOIN event_sessions s ON s.event_id = e.id
-    WHERE e.id = ANY(%s)
-      AND s.start_ts >= %s::date
-      AND s.start_ts <  (%s::date + INTERVAL '1 day')
-    ORDER BY s.start_ts
+
+
+# The (event_id, dwell) pairs arrive as parallel array parameters through
+# unnest, so the statement text stays identical across requests and keeps
+# benefiting from server-side prepared statements (see api.pool
+# prepare_threshold); inlining them as literals would force a fresh
+# PREPARE per /solve.
+_CANDIDATES_SQL = """
+SELECT e.id AS event_id,
+       e.event_name,
+       e.min_dwell_min,
+       d.dwell AS requested_dwell_min,
+       v.id AS venue_id,
+       v.name AS venue_name,
+       v.address,
+       v.lat,
+       v.lng,
+       s.start_ts,
+       s.end_ts
+FROM unnest(%s::text[], %s::int[]) AS d(id, dwell)
+JOIN events e ON e.id = d.id
+JOIN venues v ON v.id = e.venue_id
+JOIN event_sessions s ON s.event_id = e.id
+WHERE s.start_ts >= %s::date
+  AND s.start_ts <  (%s::date + INTERVAL '1 day')
+ORDER BY e.id, s.start_ts
+"""
+
+
+def fetch_candidates(
+    conn: psycopg.Connection,
+    dwell_items: Sequence[Tuple[str, Optional[int]]],
+    target_date: date,
+) -> List[Dict[str, object]]:
+    """Fetch candidate sessions with the requested dwell joined in SQL.
+
+    The (event_id, requested dwell) pairs from the request are joined as an
+    unnested array table so candidates and dwell preferences come back in
+    one round-trip instead of being reconciled in Python afterwards.
     """
-    with conn.cursor() as cur:
-        ev_ids = list(event_ids)
-        cur.execute(sql, (ev_ids, str(target_date), str(target_date)))
-        cols = [c.name for c in cur.description]
-        return [dict(zip(cols, row)) for row in cur.fetchall()]
-
-
-def build_dwell_map(events: Iterable[SolveEvent], default_min: int = 15) -> Dict[str, int]:
-    dwell_map: Dict[str, int] = {}
-    for ev in events:
-        dwell_map[ev.id] = int(ev.dwell_min or default_min)
-    return dwell_map
+    if not dwell_items:
+        return []
+    event_ids = [event_id for event_id, _ in dwell_items]
+    dwells = [dwell_min for _, dwell_min in dwell_items]
+    # A named cursor streams rows from the server in batches instead of
+    # buffering the whole result set client-side before the first row.
+    with conn.cursor(name="candidates", row_factory=dict_row) as cur:
+        cur.itersize = 200
+        cur.execute(_CANDIDATES_SQL, (event_ids, dwells, str(target_date), str(target_date)))
+        return list(cur)
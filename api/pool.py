@@ -0,0 +1,39 @@
+"""Shared psycopg connection pools, one per DSN."""
+from __future__ import annotations
+
+import os
+from functools import lru_cache
+from typing import Dict
+
+from psycopg_pool import ConnectionPool
+
+_POOLS: Dict[str, ConnectionPool] = {}
+
+
+@lru_cache(maxsize=4)
+def get_pool(dsn: str) -> ConnectionPool:
+    """Return the process-wide connection pool for ``dsn``.
+
+    Pooled connections avoid the TCP/TLS + auth round-trip that a fresh
+    ``psycopg.connect`` pays on every short query.
+    """
+    pool = ConnectionPool(
+        dsn,
+        min_size=int(os.getenv("PG_POOL_MIN", "4")),
+        max_size=int(os.getenv("PG_POOL_MAX", "32")),
+        # prepare_threshold=0 promotes every repeated statement to a
+        # server-side prepared statement, skipping re-parse/re-plan on the
+        # hot cache lookups.
+        kwargs={"prepare_threshold": 0},
+        open=True,
+    )
+    _POOLS[dsn] = pool
+    return pool
+
+
+def close_pools() -> None:
+    """Close every pool opened by :func:`get_pool` (app shutdown hook)."""
+    while _POOLS:
+        _, pool = _POOLS.popitem()
+        pool.close()
+    get_pool.cache_clear()
@@ -37,6 +37,7 @@ def get_directions_repo(dsn: str) -> DirectionsCacheRepository:
     return DirectionsCacheRepository(dsn, ttl_minutes=ttl)
 
 
+@lru_cache(maxsize=4)
 def build_travel_provider(dsn: str) -> TravelTimeProvider:
     provider_name = os.environ.get("MATRIX_PROVIDER", "straight").lower()
     if provider_name == "mapbox":
@@ -49,6 +50,7 @@ def build_travel_provider(dsn: str) -> TravelTimeProvider:
     return StraightLineTravel()
 
 
+@lru_cache(maxsize=4)
 def build_directions_provider(dsn: str) -> DirectionsProvider:
     provider_name = os.environ.get("DIRECTIONS_PROVIDER", "mapbox").lower()
     token = _mapbox_token() or ""
@@ -68,6 +68,7 @@ class SolveMetrics(BaseModel):
     totalWalkSec: int
     solver: str
     solveMs: Optional[int] = None
+    cacheHitRate: Optional[float] = None
 
 
 class SolveResponse(BaseModel):
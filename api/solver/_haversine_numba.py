@@ -0,0 +1,35 @@
+"""Numba-compiled scalar haversine fast path.
+
+Importing this module raises ImportError when numba is not installed;
+callers guard the import and fall back to the pure-Python
+:func:`api.solver.util.haversine_m`. The compiled versions run in a few
+hundred nanoseconds per call versus microseconds for the interpreted one,
+which matters on the per-pair paths that do not use the vectorised matrix.
+"""
+from __future__ import annotations
+
+import math
+
+from numba import njit
+
+
+@njit(cache=True, fastmath=True)
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    r = 6371000.0
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlmb = math.radians(lng2 - lng1)
+    h = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * r * math.asin(math.sqrt(h))
+
+
+@njit(cache=True, fastmath=True)
+def haversine_seconds(lat1: float, lng1: float, lat2: float, lng2: float, inv_speed: float) -> float:
+    return haversine_m(lat1, lng1, lat2, lng2) * inv_speed
+
+
+# Prime the compiled functions at import (cache=True makes this a cheap
+# disk-cache load after the first run) so the first solver call does not
+# pay the JIT cost.
+haversine_seconds(0.0, 0.0, 0.0, 0.0, 1.0)
@@ -1,13 +1,15 @@
 """Directions provider implementations."""
 from __future__ import annotations
 
+import atexit
 import logging
 from datetime import datetime
 from typing import Dict, Optional, Sequence, Tuple
 
 import httpx
+import orjson
 
-from ..cache import DirectionsCacheKey, DirectionsCacheRepository
+from ..cache import DirectionsCacheKey, DirectionsCacheRepository, _MemoryLayer, quantise
 from .util import encode_polyline
 
 logger = logging.getLogger(__name__)
@@ -54,6 +56,21 @@ class MapboxDirectionsProvider(DirectionsProvider):
         self.token = token
         self.profile = profile
         self.timeout = timeout
+        # Keep-alive client shared across directions calls; see
+        # MapboxMatrixProvider for the rationale.
+        self._client = httpx.Client(
+            http2=True,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_keepalive_connections=20,
+                max_connections=100,
+                keepalive_expiry=30.0,
+            ),
+        )
+        atexit.register(self.close)
+
+    def close(self) -> None:
+        self._client.close()
 
     def get_directions(
         self,
@@ -70,9 +87,9 @@ class MapboxDirectionsProvider(DirectionsProvider):
             "steps": "false",
         }
         url = f"{self.base_url}/{self.profile}/{coords}"
-        response = httpx.get(url, params=params, timeout=self.timeout)
+        response = self._client.get(url, params=params)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         routes = data.get("routes") or []
         if not routes:
             raise RuntimeError("no routes in Mapbox response")
@@ -100,6 +117,10 @@ class CachedDirectionsProvider(DirectionsProvider):
         self.fallback = fallback or StraightLineDirectionsProvider()
         self.provider_name = provider_name
         self.mode = mode
+        # Hot pairs (same depot, consecutive solves) short-circuit here on a
+        # quantised ~1 m coordinate key before any repo round-trip; entries
+        # expire on the same TTL as the backing table.
+        self._memo = _MemoryLayer(maxsize=4096, ttl_minutes=repo.ttl_minutes)
 
     def get_directions(
         self,
@@ -108,16 +129,24 @@ class CachedDirectionsProvider(DirectionsProvider):
         *,
         departure: Optional[datetime] = None,
     ) -> DirectionsResult:
-        key = DirectionsCacheKey(self.provider_name, self.mode, tuple(origin), tuple(destination))
+        memo_key = (
+            f"{origin[0]:.5f},{origin[1]:.5f}|{destination[0]:.5f},{destination[1]:.5f}"
+        )
+        memoed = self._memo.get(memo_key)
+        if memoed is not None:
+            return memoed
+        key = DirectionsCacheKey(self.provider_name, self.mode, quantise(origin), quantise(destination))
         cached = self.repo.get(key)
         if cached:
-            return {
+            result = {
                 "provider": self.provider_name,
                 "polyline": cached.get("polyline"),
                 "durationSec": cached.get("duration_sec"),
                 "distanceM": cached.get("distance_m"),
                 "cached": True,
             }
+            self._memo.put(memo_key, result)
+            return result
         try:
             result = self.provider.get_directions(origin, destination, departure=departure)
             self.repo.store(
@@ -128,6 +157,7 @@ class CachedDirectionsProvider(DirectionsProvider):
                 result,
             )
             result["cached"] = False
+            self._memo.put(memo_key, result)
             return result
         except Exception as exc:  # pragma: no cover - network branch
             logger.warning("directions provider failed (%s); using straight polyline", exc)
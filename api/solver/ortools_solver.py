@@ -3,6 +3,7 @@ from __future__ import annotations
 
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
@@ -16,14 +17,23 @@ except ImportError as exc:  # pragma: no cover - depends on optional extra
 else:
     _IMPORT_ERROR = None
 
+import numpy as np
+
 from .. import db
 from ..schemas import DroppedReason, SolveRequest, SolveResponse, StopOut
 from .directions import DirectionsProvider, StraightLineDirectionsProvider
-from .travel import StraightLineTravel, TravelTimeProvider, TravelTimeWrapper
+from .travel import (
+    CachedTravelProvider,
+    MapboxMatrixProvider,
+    StraightLineTravel,
+    TravelTimeProvider,
+    TravelTimeWrapper,
+)
 from .util import (
+    SessionBatch,
     SessionNode,
-    clamp_time_window,
     earliest_departure,
+    feasible_mask,
     summarise_drop_reason,
 )
 
@@ -33,6 +43,8 @@ class SolverConfig:
     time_limit_sec: float = 2.5
     drop_penalty: Optional[int] = None
     slack_max: int = 900  # seconds
+    max_solutions: Optional[int] = None  # stop after this many solutions
+    plateau_ms: Optional[int] = None  # stop after this long without improvement
 
 
 class ORToolsUnavailable(RuntimeError):
@@ -57,6 +69,61 @@ def _make_directions_provider(provider: DirectionsProvider | None) -> Directions
     return provider or StraightLineDirectionsProvider()
 
 
+def _find_matrix_provider(travel: TravelTimeProvider) -> Optional[MapboxMatrixProvider]:
+    """Walk the provider chain looking for a batch-capable Mapbox provider."""
+    seen = set()
+    current: Optional[TravelTimeProvider] = travel
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(current, MapboxMatrixProvider):
+            return current
+        current = getattr(current, "provider", None) or getattr(current, "inner", None)
+    return None
+
+
+def _find_cached_provider(travel: TravelTimeProvider) -> Optional[CachedTravelProvider]:
+    """Walk the provider chain looking for the caching layer, if present."""
+    seen = set()
+    current: Optional[TravelTimeProvider] = travel
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if isinstance(current, CachedTravelProvider):
+            return current
+        current = getattr(current, "provider", None) or getattr(current, "inner", None)
+    return None
+
+
+def _make_search_monitor(routing: "pywrapcp.RoutingModel", cfg: SolverConfig):
+    """Build a monitor that halts search early on enough solutions or a plateau.
+
+    Defined lazily because pywrapcp.SearchMonitor only exists when the
+    ortools extra is installed.
+    """
+    solver = routing.solver()
+
+    class _StopMonitor(pywrapcp.SearchMonitor):  # type: ignore[misc]
+        def __init__(self) -> None:
+            super().__init__(solver)
+            self.solutions = 0
+            self.best_cost: Optional[int] = None
+            self.last_improvement = time.perf_counter()
+
+        def AtSolution(self) -> bool:
+            self.solutions += 1
+            cost = routing.CostVar().Max()
+            if self.best_cost is None or cost < self.best_cost:
+                self.best_cost = cost
+                self.last_improvement = time.perf_counter()
+            plateau = (time.perf_counter() - self.last_improvement) * 1000.0
+            if cfg.max_solutions is not None and self.solutions >= cfg.max_solutions:
+                solver.FinishCurrentSearch()
+            elif cfg.plateau_ms is not None and plateau >= cfg.plateau_ms:
+                solver.FinishCurrentSearch()
+            return True
+
+    return _StopMonitor()
+
+
 def _departure_hint(start_dt: datetime, node: SessionNode) -> timedelta:
     if node.session_start:
         return node.session_start - start_dt
@@ -82,11 +149,10 @@ def solve_ortools(
 
     start_dt, end_dt = req.start.time, req.endTime
     target_date = start_dt.date()
-    dwell_overrides = db.build_dwell_map(req.events)
 
     with db.get_conn(dsn) as conn:
-        event_ids = [ev.id for ev in req.events]
-        rows = db.fetch_candidates(conn, event_ids, target_date)
+        dwell_items = [(ev.id, ev.dwell_min) for ev in req.events]
+        rows = db.fetch_candidates(conn, dwell_items, target_date)
 
     if not rows:
         dropped = [DroppedReason(eventId=e.id, reason="no_sessions_on_date") for e in req.events]
@@ -110,10 +176,17 @@ def solve_ortools(
     horizon = max(0, int((end_dt - start_dt).total_seconds()))
     depot.tw_end = horizon
 
-    node_per_event: Dict[str, List[SessionNode]] = defaultdict(list)
+    session_nodes: List[SessionNode] = []
+    # Unclamped latest feasible starts, parallel to session_nodes: the
+    # feasibility prune needs them because clamping erases the difference
+    # between an exact-fit window and one the dwell does not fit.
+    latest_starts: List[int] = []
+    # All windows per event, including ones pruned below, so drop reasons
+    # can still distinguish conflicts from beyond-horizon sessions.
+    window_per_event: Dict[str, List[Dict[str, int]]] = defaultdict(list)
     for row in rows:
         event_default = int(row.get("min_dwell_min") or 15)
-        requested = dwell_overrides.get(row["event_id"])
+        requested = row.get("requested_dwell_min")
         if requested is None:
             dwell_minutes = event_default
         else:
@@ -126,7 +199,10 @@ def solve_ortools(
         start_offset = int((s_start - start_dt).total_seconds())
         end_offset = int((s_end - start_dt).total_seconds())
         latest_start = min(horizon, end_offset - dwell_sec)
-        tw = clamp_time_window(start_offset, latest_start)
+        # clamp_time_window inlined: two max calls beat a dict allocation in
+        # this per-row loop.
+        tw_start = max(0, start_offset)
+        tw_end = max(tw_start, latest_start)
         node = SessionNode(
             event_id=row["event_id"],
             session_start=s_start,
@@ -134,8 +210,8 @@ def solve_ortools(
             lat=float(row["lat"]),
             lng=float(row["lng"]),
             service_sec=dwell_sec,
-            tw_start=tw["start"],
-            tw_end=tw["end"],
+            tw_start=tw_start,
+            tw_end=tw_end,
             venue={
                 "name": row["venue_name"],
                 "address": row["address"],
@@ -143,8 +219,27 @@ def solve_ortools(
                 "lng": float(row["lng"]),
             },
         )
+        session_nodes.append(node)
+        latest_starts.append(latest_start)
+        window_per_event[row["event_id"]].append({"start": tw_start, "end": tw_end})
+
+    # Sessions the solver could never visit (dwell does not fit before the
+    # session ends, or the window opens at/past the horizon) are pruned here
+    # in one vectorised pass, so the O(N^2) matrix build and the routing
+    # model only see viable nodes.
+    if session_nodes:
+        count = len(session_nodes)
+        keep = feasible_mask(
+            np.fromiter((n.tw_start for n in session_nodes), dtype=np.int64, count=count),
+            np.fromiter(latest_starts, dtype=np.int64, count=count),
+            horizon,
+        )
+        session_nodes = [n for n, ok in zip(session_nodes, keep.tolist()) if ok]
+
+    node_per_event: Dict[str, List[SessionNode]] = defaultdict(list)
+    for node in session_nodes:
         nodes.append(node)
-        node_per_event[row["event_id"]].append(node)
+        node_per_event[node.event_id].append(node)
 
     sink = SessionNode(
         event_id=None,
@@ -166,66 +261,172 @@ def solve_ortools(
         cfg.drop_penalty = max(3000, horizon * 4)
 
     num_nodes = len(nodes)
-    travel_matrix: List[List[int]] = [[0 for _ in range(num_nodes)] for _ in range(num_nodes)]
-    source_matrix: List[List[Dict[str, object]]] = [[{} for _ in range(num_nodes)] for _ in range(num_nodes)]
-
-    for i, src in enumerate(nodes):
-        origin = (src.lat, src.lng) if src.lat is not None and src.lng is not None else None
-        departure_dt = start_dt + _departure_hint(start_dt, src)
-        for j, dst in enumerate(nodes):
-            if i == j or dst.lat is None or dst.lng is None or origin is None:
-                travel_matrix[i][j] = 0
-                source_matrix[i][j] = {"provider": "none"}
-                continue
-            seconds, meta = travel.travel_seconds(origin, (dst.lat, dst.lng), departure=departure_dt)
-            travel_matrix[i][j] = max(0, seconds)
-            meta_copy = dict(meta) if isinstance(meta, dict) else {"value": meta}
-            meta_copy.update({"from": src.event_id, "to": dst.event_id})
-            source_matrix[i][j] = meta_copy
+    # 4 bytes per cell and contiguous rows; for typical N the whole matrix
+    # sits in cache instead of N^2 boxed Python ints.
+    travel_matrix = np.zeros((num_nodes, num_nodes), dtype=np.int32)
+    # Per-arc provenance is sparse: only pairs that were actually resolved get
+    # an entry, instead of pre-allocating N^2 empty dicts that are mostly
+    # never read (the route touches at most N arcs).
+    source_meta: Dict[tuple, Dict[str, object]] = {}
+
+    batch = SessionBatch.from_nodes(nodes)
+    located = batch.located_indices()
+
+    # Per-row constants for the matrix fill. The inner pair loops run N^2
+    # times; hoisting the coord tuples and departure hints out of them leaves
+    # only indexed lookups inside.
+    origins = [
+        (n.lat, n.lng) if n.lat is not None and n.lng is not None else None for n in nodes
+    ]
+    departures = [start_dt + _departure_hint(start_dt, n) for n in nodes]
+
+    inner = travel.inner if isinstance(travel, TravelTimeWrapper) else travel
+    if isinstance(inner, StraightLineTravel):
+        # The provider computes all pairwise walking times in one vectorised
+        # pass instead of N^2 scalar haversine calls.
+        line = StraightLineTravel(walking_speed=req.walkingSpeed)
+        seconds_mat, dist = line.travel_matrix(np.column_stack((batch.lat[located], batch.lng[located])))
+        for a, i in enumerate(located):
+            src = nodes[i]
+            for b, j in enumerate(located):
+                if i == j:
+                    continue
+                travel_matrix[i, j] = max(0, int(seconds_mat[a, b]))
+                source_meta[i, j] = {
+                    "provider": "straight_line",
+                    "distanceM": float(dist[a, b]),
+                    "from": src.event_id,
+                    "to": nodes[j].event_id,
+                }
+    elif (cached := _find_cached_provider(travel)) is not None:
+        # Cached pairs are resolved with one repo.get_many round-trip; only
+        # the misses hit the (batched) provider and are persisted in bulk.
+        coords = list(zip(batch.lat[located].tolist(), batch.lng[located].tolist()))
+        seconds_mat, metas = cached.travel_matrix_cached(coords, departure=start_dt)
+        for a, i in enumerate(located):
+            src = nodes[i]
+            for b, j in enumerate(located):
+                if i == j:
+                    continue
+                travel_matrix[i, j] = max(0, int(seconds_mat[a][b]))
+                meta_copy = dict(metas[a][b])
+                meta_copy.update({"from": src.event_id, "to": nodes[j].event_id})
+                source_meta[i, j] = meta_copy
+    elif (mapbox := _find_matrix_provider(travel)) is not None:
+        # One (tiled) Matrix API call covers every pair at once; only pairs
+        # the API could not route fall back to single-pair lookups.
+        coords = list(zip(batch.lat[located].tolist(), batch.lng[located].tolist()))
+        durations, distances = mapbox.travel_matrix(coords)
+        for a, i in enumerate(located):
+            src = nodes[i]
+            departure_dt = departures[i]
+            for b, j in enumerate(located):
+                if i == j:
+                    continue
+                seconds = durations[a][b]
+                if seconds is None:
+                    seconds, meta = travel.travel_seconds(
+                        coords[a], coords[b], departure=departure_dt
+                    )
+                    meta_copy = dict(meta) if isinstance(meta, dict) else {"value": meta}
+                else:
+                    meta_copy = {
+                        "provider": "mapbox",
+                        "profile": mapbox.profile,
+                        "distanceM": distances[a][b],
+                        "batch": True,
+                    }
+                travel_matrix[i, j] = max(0, int(seconds))
+                meta_copy.update({"from": src.event_id, "to": nodes[j].event_id})
+                source_meta[i, j] = meta_copy
+    else:
+        # Network-backed providers: the pairs are independent lookups, so
+        # fan them out over a small thread pool instead of fetching the
+        # N^2 - N entries serially.
+        tasks: List[tuple] = []
+        tasks_append = tasks.append
+        for i in range(num_nodes):
+            origin = origins[i]
+            departure_dt = departures[i]
+            for j in range(num_nodes):
+                if i == j or origin is None or origins[j] is None:
+                    travel_matrix[i][j] = 0
+                    source_meta[i, j] = {"provider": "none"}
+                    continue
+                tasks_append((i, j, origin, origins[j], departure_dt))
+
+        travel_seconds = travel.travel_seconds
+
+        def _fetch_pair(task: tuple) -> tuple:
+            i, j, origin, dest, departure_dt = task
+            seconds, meta = travel_seconds(origin, dest, departure=departure_dt)
+            return i, j, seconds, meta
+
+        if tasks:
+            with ThreadPoolExecutor(max_workers=min(16, len(tasks))) as executor:
+                for i, j, seconds, meta in executor.map(_fetch_pair, tasks):
+                    travel_matrix[i, j] = max(0, seconds)
+                    meta_copy = dict(meta) if isinstance(meta, dict) else {"value": meta}
+                    meta_copy.update({"from": nodes[i].event_id, "to": nodes[j].event_id})
+                    source_meta[i, j] = meta_copy
 
     global _LAST_DEBUG
     _LAST_DEBUG = {
         "nodes": [node.to_debug_dict() for node in nodes],
-        "matrix": {"travel": travel_matrix, "sources": source_matrix},
+        "matrix": {
+            "travel": travel_matrix.tolist(),
+            "sources": {f"{i},{j}": meta for (i, j), meta in source_meta.items()},
+        },
         "params": {
             "dropPenalty": cfg.drop_penalty,
             "horizonSec": horizon,
-            "eventCount": len(node_per_event),
+            "eventCount": len(window_per_event),
             "compressDwell": req.compressDwellToMin,
         },
     }
 
+    # Hand the whole transit matrix to OR-Tools once: arc evaluations then
+    # stay in C++ instead of crossing back into Python for every lookup.
+    combined = (travel_matrix + batch.service_sec[:, None]).tolist()
+
+    # The model is rebuilt per solve: the Time dimension stays bound to the
+    # transit callback it was created with, so a cached model refreshed with
+    # a new matrix would propagate arrival times from stale data.
     manager = pywrapcp.RoutingIndexManager(num_nodes, 1, [depot.index], [sink.index])
     routing = pywrapcp.RoutingModel(manager)
 
-    def transit_cb(from_index: int, to_index: int) -> int:
-        i = manager.IndexToNode(from_index)
-        j = manager.IndexToNode(to_index)
-        service = nodes[i].service_sec
-        travel_time = travel_matrix[i][j]
-        return service + travel_time
-
-    transit_idx = routing.RegisterTransitCallback(transit_cb)
+    transit_idx = routing.RegisterTransitMatrix(combined)
     routing.SetArcCostEvaluatorOfAllVehicles(transit_idx)
 
     routing.AddDimension(transit_idx, cfg.slack_max, horizon, True, "Time")
     time_dim = routing.GetDimensionOrDie("Time")
 
+    # Each NodeToIndex call crosses into C++; resolve them once and index
+    # the array in the time-window and disjunction loops.
+    n2i = [manager.NodeToIndex(i) for i in range(num_nodes)]
     for node in nodes:
-        idx = manager.NodeToIndex(node.index)
         start = max(0, node.tw_start)
         end = max(start, node.tw_end)
-        time_dim.CumulVar(idx).SetRange(start, end)
+        time_dim.CumulVar(n2i[node.index]).SetRange(start, end)
 
     for event_id, event_nodes in node_per_event.items():
-        disjunction = [manager.NodeToIndex(n.index) for n in event_nodes]
-        routing.AddDisjunction(disjunction, cfg.drop_penalty, 1)
+        routing.AddDisjunction([n2i[n.index] for n in event_nodes], cfg.drop_penalty, 1)
 
     params = pywrapcp.DefaultRoutingSearchParameters()
     params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
     params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
     params.time_limit.FromSeconds(max(1, int(cfg.time_limit_sec)))
 
+    monitor = None
+    if cfg.max_solutions is not None or cfg.plateau_ms is not None:
+        # Interactive solves can hand back the incumbent well before the hard
+        # time limit once search stops producing better routes. The local
+        # binding must outlive the solve: AddSearchMonitor does not take
+        # ownership of the SWIG director, so without a Python reference the
+        # monitor can be garbage-collected mid-search.
+        monitor = _make_search_monitor(routing, cfg)
+        routing.solver().AddSearchMonitor(monitor)
+
     start_ms = time.perf_counter()
     solution = routing.SolveWithParameters(params)
     duration_ms = int((time.perf_counter() - start_ms) * 1000)
@@ -241,59 +442,75 @@ def solve_ortools(
         }
         return SolveResponse(route=[], dropped=dropped, metrics=metrics)
 
-    route: List[StopOut] = []
     visited_events: Dict[str, bool] = {}
     total_walk = 0
 
+    # First pass: walk the solution and record the visit order; the network
+    # work happens afterwards.
+    visits: List[tuple] = []
     index = routing.Start(0)
     prev_node_index = manager.IndexToNode(index)
     while not routing.IsEnd(index):
         node_index = manager.IndexToNode(index)
         next_index = solution.Value(routing.NextVar(index))
         if 0 < node_index < sink.index:
-            node = nodes[node_index]
             arrive_sec = solution.Value(time_dim.CumulVar(index))
-            arrive_dt = start_dt + timedelta(seconds=arrive_sec)
-            depart_dt = earliest_departure(arrive_dt, node.service_sec)
-            walk_sec = travel_matrix[prev_node_index][node_index]
-            total_walk += walk_sec
-            origin_node = nodes[prev_node_index]
-            origin_pos = (origin_node.lat, origin_node.lng)
-            dest_pos = (node.lat, node.lng)
-            directions_meta = {}
-            if origin_pos[0] is not None and origin_pos[1] is not None and dest_pos[0] is not None and dest_pos[1] is not None:
-                directions_meta = directions_provider.get_directions(
-                    (origin_pos[0], origin_pos[1]),
-                    (dest_pos[0], dest_pos[1]),
-                    departure=arrive_dt,
-                )
-            route.append(
-                StopOut(
-                    eventId=node.event_id or "",
-                    sessionStart=node.session_start,
-                    sessionEnd=node.session_end,
-                    arrive=arrive_dt,
-                    depart=depart_dt,
-                    dwellSec=node.service_sec,
-                    travelSecFromPrev=walk_sec,
-                    venue=node.venue,
-                    polyline=directions_meta.get("polyline") if directions_meta else None,
-                    source={
-                        "travel": source_matrix[prev_node_index][node_index],
-                        "directions": directions_meta,
-                    },
-                )
-            )
-            if node.event_id:
-                visited_events[node.event_id] = True
+            visits.append((prev_node_index, node_index, arrive_sec))
         prev_node_index = node_index
         index = next_index
 
+    # Directions lookups along the route are independent; fetch them
+    # concurrently instead of one serial round-trip per stop.
+    def _fetch_directions(visit: tuple) -> Dict[str, object]:
+        prev_idx, node_idx, arrive_sec = visit
+        origin_node = nodes[prev_idx]
+        node = nodes[node_idx]
+        if origin_node.lat is None or origin_node.lng is None or node.lat is None or node.lng is None:
+            return {}
+        return directions_provider.get_directions(
+            (origin_node.lat, origin_node.lng),
+            (node.lat, node.lng),
+            departure=start_dt + timedelta(seconds=arrive_sec),
+        )
+
+    if len(visits) > 1:
+        with ThreadPoolExecutor(max_workers=min(8, len(visits))) as executor:
+            directions_list = list(executor.map(_fetch_directions, visits))
+    else:
+        directions_list = [_fetch_directions(v) for v in visits]
+
+    route: List[StopOut] = []
+    for (prev_idx, node_idx, arrive_sec), directions_meta in zip(visits, directions_list):
+        node = nodes[node_idx]
+        arrive_dt = start_dt + timedelta(seconds=arrive_sec)
+        depart_dt = earliest_departure(arrive_dt, node.service_sec)
+        walk_sec = int(travel_matrix[prev_idx, node_idx])
+        total_walk += walk_sec
+        route.append(
+            StopOut(
+                eventId=node.event_id or "",
+                sessionStart=node.session_start,
+                sessionEnd=node.session_end,
+                arrive=arrive_dt,
+                depart=depart_dt,
+                dwellSec=node.service_sec,
+                travelSecFromPrev=walk_sec,
+                venue=node.venue,
+                polyline=directions_meta.get("polyline") if directions_meta else None,
+                source={
+                    "travel": source_meta.get((prev_idx, node_idx), {}),
+                    "directions": directions_meta,
+                },
+            )
+        )
+        if node.event_id:
+            visited_events[node.event_id] = True
+
     dropped: List[DroppedReason] = []
     for event in req.events:
         if visited_events.get(event.id):
             continue
-        tws = [{"start": n.tw_start, "end": n.tw_end} for n in node_per_event.get(event.id, [])]
+        tws = window_per_event.get(event.id, [])
         dropped.append(DroppedReason(**summarise_drop_reason(event.id, tws, horizon)))
 
     metrics = {
@@ -303,4 +520,6 @@ def solve_ortools(
         "solver": "ortools-tsp-tw",
         "solveMs": duration_ms,
     }
+    if (cached := _find_cached_provider(travel)) is not None:
+        metrics["cacheHitRate"] = round(cached.cache_hit_rate, 3)
     return SolveResponse(route=route, dropped=dropped, metrics=metrics)
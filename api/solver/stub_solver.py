@@ -1,8 +1,9 @@
 """Greedy fallback solver."""
 from __future__ import annotations
 
-from collections import defaultdict
 from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
 from typing import Dict, List, Sequence
 
 from .. import db
@@ -30,33 +31,36 @@ def solve_stub(
 ) -> SolveResponse:
     start_dt, end_dt = req.start.time, req.endTime
     target_date = start_dt.date()
-    dwell_map = db.build_dwell_map(req.events)
     travel = _make_travel_provider(req, provider)
     directions_provider = _make_directions_provider(directions)
 
     with db.get_conn(dsn) as conn:
-        event_ids = [e.id for e in req.events]
-        rows = db.fetch_candidates(conn, event_ids, target_date)
+        dwell_items = [(e.id, e.dwell_min) for e in req.events]
+        rows = db.fetch_candidates(conn, dwell_items, target_date)
 
     if not rows:
         metrics = {"visited": 0, "dropped": len(req.events), "totalWalkSec": 0, "solver": "stub"}
         dropped = [DroppedReason(eventId=e.id, reason="no_sessions_on_date") for e in req.events]
         return SolveResponse(route=[], dropped=dropped, metrics=metrics)
 
-    sessions_by_event: Dict[str, List[Dict[str, object]]] = defaultdict(list)
+    # fetch_candidates orders by (event_id, start_ts), so one groupby pass
+    # yields each event's sessions already sorted — no per-bucket sort needed.
+    sessions_by_event: Dict[str, List[Dict[str, object]]] = {}
     venue_by_event: Dict[str, Dict[str, object]] = {}
     event_min_map: Dict[str, int] = {}
-    for row in rows:
-        sessions_by_event[row["event_id"]].append(row)
-        event_min_map[row["event_id"]] = int(row.get("min_dwell_min") or 15)
-        venue_by_event[row["event_id"]] = {
-            "name": row["venue_name"],
-            "address": row["address"],
-            "lat": float(row["lat"]),
-            "lng": float(row["lng"]),
+    requested_map: Dict[str, object] = {}
+    for event_id, group in groupby(rows, key=itemgetter("event_id")):
+        sessions = list(group)
+        first = sessions[0]
+        sessions_by_event[event_id] = sessions
+        event_min_map[event_id] = int(first.get("min_dwell_min") or 15)
+        requested_map[event_id] = first.get("requested_dwell_min")
+        venue_by_event[event_id] = {
+            "name": first["venue_name"],
+            "address": first["address"],
+            "lat": float(first["lat"]),
+            "lng": float(first["lng"]),
         }
-    for sess in sessions_by_event.values():
-        sess.sort(key=lambda r: r["start_ts"])
 
     curr_time = start_dt
     curr_pos: Sequence[float] = (req.start.lat, req.start.lng)
@@ -65,9 +69,9 @@ def solve_stub(
     dropped: List[DroppedReason] = []
 
     for ev in req.events:
-        attempts: List[Dict[str, object]] = []
+        evaluated: List[tuple] = []
         picked = None
-        requested = dwell_map.get(ev.id)
+        requested = requested_map.get(ev.id)
         event_min = event_min_map.get(ev.id, 15)
         if requested is None:
             dwell_minutes = event_min
@@ -81,15 +85,7 @@ def solve_stub(
             walk_sec, travel_meta = travel.travel_seconds(curr_pos, venue_pos, departure=curr_time)
             arrival = max(curr_time + timedelta(seconds=walk_sec), sess["start_ts"])
             depart = earliest_departure(arrival, dwell_sec)
-            attempts.append(
-                {
-                    "sessionStart": sess["start_ts"].isoformat(),
-                    "sessionEnd": sess["end_ts"].isoformat(),
-                    "walkSec": walk_sec,
-                    "arrival": arrival.isoformat(),
-                    "depart": depart.isoformat(),
-                }
-            )
+            evaluated.append((sess, walk_sec, arrival, depart))
             if depart <= sess["end_ts"] and depart <= end_dt:
                 picked = (sess, walk_sec, arrival, depart, travel_meta, venue_pos)
                 break
@@ -121,8 +117,20 @@ def solve_stub(
             curr_pos = venue_pos
         else:
             reason = "no_feasible_session_within_windows"
-            if not attempts:
+            if not evaluated:
                 reason = "no_sessions_for_event"
+            # The debug detail is only rendered for dropped events, so the
+            # isoformat conversions happen here rather than per attempt above.
+            attempts = [
+                {
+                    "sessionStart": sess["start_ts"].isoformat(),
+                    "sessionEnd": sess["end_ts"].isoformat(),
+                    "walkSec": walk_sec,
+                    "arrival": arrival.isoformat(),
+                    "depart": depart.isoformat(),
+                }
+                for sess, walk_sec, arrival, depart in evaluated
+            ]
             dropped.append(
                 DroppedReason(
                     eventId=ev.id,
@@ -1,16 +1,19 @@
 """Travel time providers used by the solver."""
 from __future__ import annotations
 
+import atexit
 import json
 import logging
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Optional, Sequence, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
 import httpx
+import numpy as np
+import orjson
 
-from ..cache import MatrixCacheKey, MatrixCacheRepository
-from .util import haversine_m
+from ..cache import MatrixCacheKey, MatrixCacheRepository, quantise
+from .util import haversine_m, haversine_matrix
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +37,11 @@ class TravelTimeProvider:
 class StraightLineTravel(TravelTimeProvider):
     walking_speed: float = 1.35
 
+    def __post_init__(self) -> None:
+        # The clamped reciprocal is invariant per provider; computing it once
+        # turns the per-call division into a multiply.
+        self._inv_speed = 1.0 / max(self.walking_speed, 0.05)
+
     def travel_seconds(
         self,
         origin: Sequence[float],
@@ -42,13 +50,28 @@ class StraightLineTravel(TravelTimeProvider):
         departure: Optional[datetime] = None,
     ) -> TravelResult:
         dist = haversine_m(origin, destination)
-        speed = max(self.walking_speed, 0.05)
-        seconds = int(dist / speed)
+        seconds = int(dist * self._inv_speed)
         return seconds, {"provider": "straight_line", "distanceM": dist}
 
+    def travel_matrix(self, coords: Sequence[Tuple[float, float]]) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Whole NxN walking-seconds matrix in one vectorised pass.
+
+        Takes (lat, lng) pairs like MapboxMatrixProvider.travel_matrix, so
+        callers can duck-type on the method across providers. Returns
+        (seconds, distances_m); seconds are truncated to int32 to match the
+        scalar travel_seconds rounding.
+        """
+        arr = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        dist = haversine_matrix(arr[:, 0], arr[:, 1])
+        seconds = (dist * self._inv_speed).astype(np.int32)
+        return seconds, dist
+
 
 class MapboxMatrixProvider(TravelTimeProvider):
     base_url = "https://api.mapbox.com/directions-matrix/v1/mapbox"
+    # The Mapbox Directions Matrix endpoint accepts at most 25 coordinates
+    # per request; larger problems are tiled into source x destination chunks.
+    max_matrix_coords = 25
 
     def __init__(
         self,
@@ -62,6 +85,22 @@ class MapboxMatrixProvider(TravelTimeProvider):
         self.token = token
         self.profile = profile
         self.timeout = timeout
+        # One keep-alive client per provider: repeated matrix calls reuse a
+        # warm TLS connection (and HTTP/2 multiplexing) instead of paying a
+        # handshake per request.
+        self._client = httpx.Client(
+            http2=True,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_keepalive_connections=20,
+                max_connections=100,
+                keepalive_expiry=30.0,
+            ),
+        )
+        atexit.register(self.close)
+
+    def close(self) -> None:
+        self._client.close()
 
     def travel_seconds(
         self,
@@ -76,9 +115,11 @@ class MapboxMatrixProvider(TravelTimeProvider):
             "annotations": "duration,distance",
         }
         url = f"{self.base_url}/{self.profile}/{coords}"
-        response = httpx.get(url, params=params, timeout=self.timeout)
+        response = self._client.get(url, params=params)
         response.raise_for_status()
-        data = response.json()
+        # orjson decodes the (potentially large) matrix payloads noticeably
+        # faster than the stdlib parser behind response.json().
+        data = orjson.loads(response.content)
         durations = data.get("durations") or []
         distances = data.get("distances") or []
         if len(durations) < 1 or len(durations[0]) < 2:
@@ -94,6 +135,58 @@ class MapboxMatrixProvider(TravelTimeProvider):
         }
         return seconds, meta
 
+    def _matrix_request(
+        self,
+        coords: Sequence[Tuple[float, float]],
+        sources: Sequence[int],
+        destinations: Sequence[int],
+    ) -> Tuple[list, list]:
+        coord_str = ";".join(f"{lng:.6f},{lat:.6f}" for lat, lng in coords)
+        params = {
+            "access_token": self.token,
+            "annotations": "duration,distance",
+            "sources": ";".join(map(str, sources)),
+            "destinations": ";".join(map(str, destinations)),
+        }
+        url = f"{self.base_url}/{self.profile}/{coord_str}"
+        response = self._client.get(url, params=params)
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        return data.get("durations") or [], data.get("distances") or []
+
+    def travel_matrix(
+        self, coords: Sequence[Tuple[float, float]]
+    ) -> Tuple[List[List[Optional[int]]], List[List[Optional[int]]]]:
+        """Fetch the full NxN duration/distance matrices in batched requests.
+
+        One request covers up to 25 coordinates; beyond that the matrix is
+        tiled so each request stays within the API limit. Either way this is
+        O(ceil(N/25)^2) HTTP calls instead of N^2 - N single-pair lookups.
+        """
+        n = len(coords)
+        durations: List[List[Optional[int]]] = [[None] * n for _ in range(n)]
+        distances: List[List[Optional[int]]] = [[None] * n for _ in range(n)]
+        step = self.max_matrix_coords if n <= self.max_matrix_coords else self.max_matrix_coords // 2
+        for si in range(0, n, step):
+            src_idx = list(range(si, min(si + step, n)))
+            for di in range(0, n, step):
+                dst_idx = list(range(di, min(di + step, n)))
+                src_set = set(src_idx)
+                subset = src_idx + [j for j in dst_idx if j not in src_set]
+                pos = {node: p for p, node in enumerate(subset)}
+                durs, dists = self._matrix_request(
+                    [coords[k] for k in subset],
+                    [pos[i] for i in src_idx],
+                    [pos[j] for j in dst_idx],
+                )
+                for a, i in enumerate(src_idx):
+                    for b, j in enumerate(dst_idx):
+                        if durs and durs[a][b] is not None:
+                            durations[i][j] = int(durs[a][b])
+                        if dists and dists[a] and dists[a][b] is not None:
+                            distances[i][j] = int(dists[a][b])
+        return durations, distances
+
 
 class TravelTimeWrapper(TravelTimeProvider):
     """Delegate provider that can override walking speed at runtime."""
@@ -101,6 +194,12 @@ class TravelTimeWrapper(TravelTimeProvider):
     def __init__(self, inner: TravelTimeProvider, walking_speed: float) -> None:
         self.inner = inner
         self.walking_speed = walking_speed
+        # Resolve the delegate once instead of re-cloning a speed-adjusted
+        # StraightLineTravel on every travel_seconds call.
+        if isinstance(inner, StraightLineTravel):
+            self._delegate: TravelTimeProvider = StraightLineTravel(walking_speed=walking_speed)
+        else:
+            self._delegate = inner
 
     def travel_seconds(
         self,
@@ -109,10 +208,7 @@ class TravelTimeWrapper(TravelTimeProvider):
         *,
         departure: Optional[datetime] = None,
     ) -> TravelResult:
-        if isinstance(self.inner, StraightLineTravel):
-            clone = StraightLineTravel(walking_speed=self.walking_speed)
-            return clone.travel_seconds(origin, destination, departure=departure)
-        return self.inner.travel_seconds(origin, destination, departure=departure)
+        return self._delegate.travel_seconds(origin, destination, departure=departure)
 
 
 class CachedTravelProvider(TravelTimeProvider):
@@ -132,6 +228,15 @@ class CachedTravelProvider(TravelTimeProvider):
         self.provider_name = provider_name
         self.mode = mode
         self.bucket = bucket
+        # Hit/miss tallies across all lookup paths; the repo's own memory
+        # layer already provides the in-process LRU in front of Postgres.
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache_hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
 
     def travel_seconds(
         self,
@@ -140,21 +245,109 @@ class CachedTravelProvider(TravelTimeProvider):
         *,
         departure: Optional[datetime] = None,
     ) -> TravelResult:
-        key = MatrixCacheKey(self.provider_name, self.mode, tuple(origin), tuple(destination), self.bucket)
+        key = MatrixCacheKey(self.provider_name, self.mode, quantise(origin), quantise(destination), self.bucket)
         cached = self.repo.get(key)
         if cached:
+            self.hits += 1
             return int(cached["duration_sec"]), {
                 "provider": self.provider_name,
                 "mode": self.mode,
                 "cached": True,
                 "distanceM": cached.get("distance_m"),
             }
+        self.misses += 1
         try:
             seconds, meta = self.provider.travel_seconds(origin, destination, departure=departure)
             distance = meta.get("distanceM") if isinstance(meta, dict) else None
             self.repo.store(key, seconds, int(distance) if distance is not None else None, meta if isinstance(meta, dict) else {})
-            return seconds, meta | {"cached": False}
+            # The provider returns a fresh dict per call, so annotating it in
+            # place avoids allocating a merged copy on every pair.
+            meta["cached"] = False
+            return seconds, meta
         except Exception as exc:  # pragma: no cover - network branch
             logger.warning("matrix provider failed (%s); falling back to straight-line", exc)
             seconds, meta = self.fallback.travel_seconds(origin, destination, departure=departure)
-            return seconds, meta | {"provider": meta.get("provider", "straight_line"), "fallback": True}
+            meta.setdefault("provider", "straight_line")
+            meta["fallback"] = True
+            return seconds, meta
+
+    def travel_matrix_cached(
+        self,
+        coords: Sequence[Tuple[float, float]],
+        *,
+        departure: Optional[datetime] = None,
+    ) -> Tuple[List[List[int]], List[List[Dict[str, object]]]]:
+        """Resolve the full NxN duration matrix, serving hits from the cache.
+
+        All pair keys are looked up with one repo.get_many round-trip; the
+        misses are then fetched (in one batched provider call when the
+        underlying provider supports travel_matrix) and persisted with
+        store_many. Returns (seconds, metas); diagonal entries are 0/{}.
+        """
+        n = len(coords)
+        seconds: List[List[int]] = [[0] * n for _ in range(n)]
+        metas: List[List[Dict[str, object]]] = [[{} for _ in range(n)] for _ in range(n)]
+        keys: Dict[Tuple[int, int], MatrixCacheKey] = {}
+        for i in range(n):
+            for j in range(n):
+                if i != j:
+                    keys[(i, j)] = MatrixCacheKey(
+                        self.provider_name, self.mode, quantise(coords[i]), quantise(coords[j]), self.bucket
+                    )
+        cached_map = self.repo.get_many(list(keys.values()))
+        misses: List[Tuple[int, int]] = []
+        for (i, j), key in keys.items():
+            row = cached_map.get(key.pack())
+            if row is not None:
+                self.hits += 1
+                seconds[i][j] = int(row["duration_sec"])
+                metas[i][j] = {
+                    "provider": self.provider_name,
+                    "mode": self.mode,
+                    "cached": True,
+                    "distanceM": row.get("distance_m"),
+                }
+            else:
+                self.misses += 1
+                misses.append((i, j))
+        if not misses:
+            return seconds, metas
+
+        batch = getattr(self.provider, "travel_matrix", None)
+        if batch is not None:
+            try:
+                durations, distances = batch(coords)
+            except Exception as exc:  # pragma: no cover - network branch
+                logger.warning("batched matrix fetch failed (%s); per-pair fallback", exc)
+                batch = None
+        if batch is not None:
+            entries = []
+            for i, j in misses:
+                sec = durations[i][j]
+                if sec is None:
+                    sec, meta = self.fallback.travel_seconds(coords[i], coords[j], departure=departure)
+                    seconds[i][j] = sec
+                    meta["fallback"] = True
+                    metas[i][j] = meta
+                    continue
+                dist = distances[i][j]
+                if dist is not None:
+                    # float() also unwraps NumPy scalars from the
+                    # straight-line matrix so meta stays JSON-serialisable.
+                    dist = float(dist)
+                meta = {
+                    "provider": self.provider_name,
+                    "mode": self.mode,
+                    "cached": False,
+                    "distanceM": dist,
+                }
+                seconds[i][j] = int(sec)
+                metas[i][j] = meta
+                entries.append((keys[(i, j)], int(sec), int(dist) if dist is not None else None, meta))
+            self.repo.store_many(entries)
+        else:
+            for i, j in misses:
+                sec, meta = self.travel_seconds(coords[i], coords[j], departure=departure)
+                seconds[i][j] = sec
+                metas[i][j] = meta if isinstance(meta, dict) else {"value": meta}
+        return seconds, metas
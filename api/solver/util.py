@@ -6,18 +6,51 @@ from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
+import numpy as np
+
+try:  # pragma: no cover - optional acceleration
+    from ._haversine_numba import haversine_m as _haversine_m_fast
+except ImportError:
+    _haversine_m_fast = None
+
 
 def haversine_m(a: Sequence[float], b: Sequence[float]) -> float:
     (lat1, lon1), (lat2, lon2) = a, b
-    r = 6371000.0
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
     dphi = math.radians(lat2 - lat1)
     dlmb = math.radians(lon2 - lon1)
+    if abs(dphi) + abs(dlmb) < 0.01:
+        # Equirectangular approximation: at walking scale (< ~60 km of
+        # combined angular delta) the error is well under a metre per km,
+        # and it needs one cos + one hypot instead of the full formula.
+        x = dlmb * math.cos(math.radians((lat1 + lat2) * 0.5))
+        return 6371000.0 * math.hypot(dphi, x)
+    if _haversine_m_fast is not None:
+        return _haversine_m_fast(float(lat1), float(lon1), float(lat2), float(lon2))
+    r = 6371000.0
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
     h = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
     return 2 * r * math.asin(math.sqrt(h))
 
 
-@dataclass
+def haversine_matrix(lats: Sequence[float], lngs: Sequence[float]) -> np.ndarray:
+    """All-pairs haversine distances (metres) for parallel lat/lng arrays.
+
+    One vectorised pass replaces O(N^2) scalar :func:`haversine_m` calls when
+    a solver needs the full distance matrix between candidate venues. Inputs
+    are kept as separate contiguous lat/lng arrays so every ufunc sees
+    sequential memory, and the final angle uses arctan2(sqrt(h), sqrt(1-h)),
+    which is numerically safer than arcsin near h=1 and runs as a single
+    ufunc pass.
+    """
+    phi = np.radians(np.ascontiguousarray(lats, dtype=np.float64))
+    lam = np.radians(np.ascontiguousarray(lngs, dtype=np.float64))
+    dphi = phi[:, None] - phi[None, :]
+    dlam = lam[:, None] - lam[None, :]
+    h = np.sin(dphi * 0.5) ** 2 + np.cos(phi)[:, None] * np.cos(phi)[None, :] * np.sin(dlam * 0.5) ** 2
+    return 2 * 6371000.0 * np.arctan2(np.sqrt(h), np.sqrt(1.0 - h))
+
+
+@dataclass(slots=True)
 class SessionNode:
     event_id: Optional[str]
     session_start: Optional[datetime]
@@ -43,6 +76,53 @@ class SessionNode:
         }
 
 
+@dataclass
+class SessionBatch:
+    """Structure-of-arrays view over a node list.
+
+    Vectorised passes (haversine matrix, window pruning) consume these
+    contiguous arrays instead of chasing per-node attribute lookups; nodes
+    without coordinates carry NaN in lat/lng.
+    """
+
+    nodes: List[SessionNode]
+    lat: np.ndarray
+    lng: np.ndarray
+    service_sec: np.ndarray
+    tw_start: np.ndarray
+    tw_end: np.ndarray
+
+    @classmethod
+    def from_nodes(cls, nodes: Sequence[SessionNode]) -> "SessionBatch":
+        n = len(nodes)
+        nan = float("nan")
+        return cls(
+            nodes=list(nodes),
+            lat=np.fromiter((node.lat if node.lat is not None else nan for node in nodes), dtype=np.float64, count=n),
+            lng=np.fromiter((node.lng if node.lng is not None else nan for node in nodes), dtype=np.float64, count=n),
+            service_sec=np.fromiter((node.service_sec for node in nodes), dtype=np.int32, count=n),
+            tw_start=np.fromiter((node.tw_start for node in nodes), dtype=np.int64, count=n),
+            tw_end=np.fromiter((node.tw_end for node in nodes), dtype=np.int64, count=n),
+        )
+
+    def located_indices(self) -> List[int]:
+        """Indices of nodes that have coordinates."""
+        return np.flatnonzero(np.isfinite(self.lat) & np.isfinite(self.lng)).tolist()
+
+
+def feasible_mask(tw_start: np.ndarray, tw_end: np.ndarray, horizon: int) -> np.ndarray:
+    """Boolean mask of time windows a solver could actually visit.
+
+    ``tw_start`` is the clamped window open and ``tw_end`` the *unclamped*
+    latest feasible start — callers must not pass the clamped end, because
+    clamping folds "dwell exactly fits" (``tw_end == tw_start``, still
+    visitable) and "dwell does not fit" (``tw_end < tw_start``) onto the
+    same zero-length window. One vectorised pass prunes unsatisfiable or
+    beyond-horizon nodes before the O(N^2) travel-matrix build.
+    """
+    return (tw_end >= tw_start) & (tw_start < horizon)
+
+
 def seconds_between(start: datetime, end: datetime) -> int:
     return max(0, int((end - start).total_seconds()))
 
@@ -63,38 +143,66 @@ def earliest_departure(arrive: datetime, dwell_sec: int) -> datetime:
 
 
 def summarise_drop_reason(event_id: str, tws: Iterable[Dict[str, int]], horizon: int) -> Dict[str, object]:
-    tws_list = list(tws)
-    if not tws_list:
+    # One pass over the windows collects everything the branches below need,
+    # instead of materialising a list and walking it per condition.
+    count = 0
+    any_pos_len = False
+    any_in_horizon = False
+    for tw in tws:
+        count += 1
+        if tw["end"] - tw["start"] > 0:
+            any_pos_len = True
+        if tw["start"] < horizon:
+            any_in_horizon = True
+    if count == 0:
         return {"eventId": event_id, "reason": "no_sessions_for_date"}
-    window_lengths = [tw["end"] - tw["start"] for tw in tws_list]
-    if all(length <= 0 for length in window_lengths):
-        return {"eventId": event_id, "reason": "time_window_conflict", "sessionsConsidered": len(tws_list)}
-    if all(tw["start"] >= horizon for tw in tws_list):
-        return {"eventId": event_id, "reason": "beyond_trip_horizon", "sessionsConsidered": len(tws_list)}
-    return {"eventId": event_id, "reason": "dropped_by_solver", "sessionsConsidered": len(tws_list)}
+    if not any_pos_len:
+        return {"eventId": event_id, "reason": "time_window_conflict", "sessionsConsidered": count}
+    if not any_in_horizon:
+        return {"eventId": event_id, "reason": "beyond_trip_horizon", "sessionsConsidered": count}
+    return {"eventId": event_id, "reason": "dropped_by_solver", "sessionsConsidered": count}
 
 
 def encode_polyline(points: Sequence[Tuple[float, float]], precision: int = 5) -> str:
     factor = 10 ** precision
-    output: List[str] = []
+    # One growable byte buffer instead of two str allocations plus a join
+    # per coordinate; the encoding is pure ASCII.
+    buf = bytearray()
+    if len(points) >= 8:
+        # Scaling, rounding and the delta chain are one vectorised pass for
+        # longer geometries; only the variable-length emission stays scalar.
+        # np.rint matches round()'s half-to-even behaviour.
+        ints = np.rint(np.asarray(points, dtype=np.float64) * factor).astype(np.int64)
+        deltas = np.empty_like(ints)
+        deltas[0] = ints[0]
+        np.subtract(ints[1:], ints[:-1], out=deltas[1:])
+        for lat_d, lng_d in deltas.tolist():
+            _encode_value(lat_d, buf)
+            _encode_value(lng_d, buf)
+        return buf.decode("ascii")
     prev_lat = 0
     prev_lng = 0
     for lat, lng in points:
         lat_i = int(round(lat * factor))
         lng_i = int(round(lng * factor))
-        output.append(_encode_value(lat_i - prev_lat))
-        output.append(_encode_value(lng_i - prev_lng))
+        _encode_value(lat_i - prev_lat, buf)
+        _encode_value(lng_i - prev_lng, buf)
         prev_lat, prev_lng = lat_i, lng_i
-    return "".join(output)
+    return buf.decode("ascii")
+
+
+# Each emitted character is a 5-bit chunk offset into one of two 32-entry
+# tables (continuation bit set or not); indexing these replaces the or/add
+# arithmetic per character.
+_CONT_LUT = bytes((0x20 | i) + 63 for i in range(32))
+_TERM_LUT = bytes(i + 63 for i in range(32))
 
 
-def _encode_value(value: int) -> str:
+def _encode_value(value: int, out: bytearray) -> None:
     value = value << 1
     if value < 0:
         value = ~value
-    result = []
     while value >= 0x20:
-        result.append(chr((0x20 | (value & 0x1F)) + 63))
+        out.append(_CONT_LUT[value & 0x1F])
         value >>= 5
-    result.append(chr(value + 63))
-    return "".join(result)
+    out.append(_TERM_LUT[value])
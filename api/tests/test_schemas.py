@@ -2,7 +2,7 @@ from datetime import datetime, timezone
 
 import pytest
 
-from api.schemas import SolveEvent, SolveRequest, StartPoint
+from api.schemas import SolveEvent, SolveRequest, SolveResponse, StartPoint
 
 
 def _start_point() -> StartPoint:
@@ -25,3 +25,14 @@ def test_end_time_must_follow_start():
             endTime=datetime(2025, 6, 11, 7, 59, tzinfo=timezone.utc),
             events=[SolveEvent(id="a")],
         )
+
+
+def test_metrics_keeps_cache_hit_rate():
+    # Guards against pydantic silently stripping the optional field when the
+    # solver's metrics dict is validated into the response model.
+    resp = SolveResponse(
+        route=[],
+        dropped=[],
+        metrics={"visited": 0, "dropped": 0, "totalWalkSec": 0, "solver": "stub", "cacheHitRate": 0.75},
+    )
+    assert resp.metrics.cacheHitRate == 0.75
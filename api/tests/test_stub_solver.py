@@ -41,7 +41,12 @@ def fake_rows() -> List[Dict[str, object]]:
 @pytest.fixture(autouse=True)
 def patch_db(monkeypatch, fake_rows):
     monkeypatch.setattr(db, "get_conn", lambda dsn: DummyConn())
-    monkeypatch.setattr(db, "fetch_candidates", lambda conn, event_ids, target_date: list(fake_rows))
+
+    def fake_fetch(conn, dwell_items, target_date):
+        requested = dict(dwell_items)
+        return [dict(row, requested_dwell_min=requested.get(row["event_id"])) for row in fake_rows]
+
+    monkeypatch.setattr(db, "fetch_candidates", fake_fetch)
     yield
 
 